@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from config import get_app_path
+
+
+class AuditEntry:
+    def __init__(self, ts: float, user_id: int, user_name: str, command: str, device_id: int | None, device_label: str, outcome: str, latency_ms: float):
+        self.ts: float = ts
+        self.user_id: int = user_id
+        self.user_name: str = user_name
+        self.command: str = command
+        self.device_id: int | None = device_id
+        self.device_label: str = device_label
+        self.outcome: str = outcome
+        self.latency_ms: float = latency_ms
+
+
+class AuditLog:
+    # Commands are queued in memory and written to sqlite in batches by a background task,
+    # so that handlers never wait on disk.
+    def __init__(self, conf: dict):
+        # empty to disable the audit log
+        self.enabled: bool = bool(conf["audit_file"])
+        self._file: str = get_app_path(conf["audit_file"]) if self.enabled else ""
+        self._retention_seconds: float = float(conf["audit_retention_days"]) * 24 * 3600
+        self._flush_interval: float = 2.0
+        self._batch_size: int = 100
+        self._pending: list[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping: bool = False
+        self._last_prune: float = 0
+        self._lock = threading.Lock()  # sqlite connection is shared between worker threads
+        if not self.enabled:
+            logging.warning("Audit log disabled.")
+            return
+        logging.info(f"Audit log: {self._file}")
+        self._conn = sqlite3.connect(self._file, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audit (ts REAL NOT NULL, user_id INTEGER NOT NULL, user_name TEXT, command TEXT NOT NULL, device_id INTEGER, device_label TEXT, outcome TEXT, latency_ms REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS audit_ts ON audit(ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS audit_user_ts ON audit(user_id, ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS audit_device_ts ON audit(device_id, ts)")
+
+    def record(self, entry: AuditEntry) -> None:
+        if not self.enabled:
+            return
+        self._pending.append((entry.ts, entry.user_id, entry.user_name, entry.command, entry.device_id, entry.device_label, entry.outcome, entry.latency_ms))
+        if len(self._pending) >= self._batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.__writer__())
+
+    async def stop(self) -> None:
+        if not self.enabled:
+            return
+        if self._task is not None:
+            # let the writer finish the batch it may be writing rather than cancelling it
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+
+    async def __writer__(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error("Unable to write audit log.", exc_info=e)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        await asyncio.to_thread(self.__write__, rows)
+
+    def __write__(self, rows: list[tuple]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO audit VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # rotation: drop entries past retention, at most once an hour
+            if self._retention_seconds > 0 and now - self._last_prune > 3600:
+                self._conn.execute("DELETE FROM audit WHERE ts < ?", (now - self._retention_seconds,))
+                self._last_prune = now
+
+    async def query(self, user_id: int | None = None, device_ids: list[int] | None = None, since: float = 0, limit: int = 20) -> list[AuditEntry]:
+        if not self.enabled:
+            return []
+        await self.flush()
+        return await asyncio.to_thread(self.__query__, user_id, device_ids, since, limit)
+
+    def __query__(self, user_id: int | None, device_ids: list[int] | None, since: float, limit: int) -> list[AuditEntry]:
+        sql = "SELECT ts, user_id, user_name, command, device_id, device_label, outcome, latency_ms FROM audit WHERE ts >= ?"
+        params: list = [since]
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(user_id)
+        if device_ids:
+            sql += f" AND device_id IN ({', '.join('?' * len(device_ids))})"
+            params += device_ids
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [AuditEntry(*row) for row in self._conn.execute(sql, params)]
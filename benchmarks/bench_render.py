@@ -0,0 +1,68 @@
+#! /usr/bin/env python3
+
+# Micro-benchmark of the /list rendering for 1k devices: regex escaping & f-strings on every reply (previous implementation)
+# vs. render.py (str.translate escaping, memoized per inventory generation).
+# Usage: python benchmarks/bench_render.py
+
+from pathlib import Path
+import re
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from device import Device
+from render import Renderer, markdown_escape
+
+DEVICES = 1000
+REPEAT = 50
+
+
+def regex_markdown_escape(text: str) -> str:
+    if not text:
+        return ""
+    text = re.sub(r"([_*\[\]()~`>\#\+\-=|\.!])", r"\\\1", text)
+    text = re.sub(r"\\\\([_*\[\]()~`>\#\+\-=|\.!])", r"\1", text)
+    return text
+
+
+def make_devices() -> list[Device]:
+    devices = []
+    for i in range(DEVICES):
+        device = Device({"id": i, "label": f"Room_{i % 50} (floor-{i % 3}) light #{i}", "type": "Generic Zigbee Bulb", "commands": [{"command": "on"}, {"command": "off"}]})
+        device.description = f"Ceiling light [{i}] near the window." if i % 2 else ""
+        devices.append(device)
+    return devices
+
+
+def render_regex(devices: list[Device]) -> list[str]:
+    def get_description(device: Device) -> str:
+        return ": " + regex_markdown_escape(device.description) if device.description else ""
+
+    return [f"{regex_markdown_escape(info.label)} {get_description(info)}" for info in devices]
+
+
+def main() -> None:
+    devices = make_devices()
+    generation = [1]
+
+    def render_cold() -> list[str]:
+        generation[0] += 1  # inventory refreshed before every reply: nothing memoized
+        return [renderer.device_row(info, False) for info in devices]
+
+    renderer = Renderer(lambda: generation[0])
+    assert render_regex(devices) == render_cold()
+    for text in ["a_b", "a\\_b", "x.y!", "", "(c) [d] `e` #f +g -h =i |j ~k >l *m"]:
+        assert regex_markdown_escape(text) == markdown_escape(text), text
+
+    results = {
+        "regex + f-strings (before)": timeit.timeit(lambda: render_regex(devices), number=REPEAT),
+        "translate, cold memo": timeit.timeit(render_cold, number=REPEAT),
+        "translate, warm memo": timeit.timeit(lambda: [renderer.device_row(info, False) for info in devices], number=REPEAT),
+    }
+    for name, seconds in results.items():
+        print(f"{name :28}: {seconds / REPEAT * 1000 :7.3f} ms per /list of {DEVICES} devices")
+
+
+if __name__ == "__main__":
+    main()
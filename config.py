@@ -6,6 +6,11 @@ from pathlib import Path
 from typing import Callable
 
 
+# files named in the configuration (e.g. audit_file) are relative to the app folder, like config.yaml
+def get_app_path(file: str) -> str:
+    return str(Path(__file__).parent / file)
+
+
 class Config:
     def __init__(self, file: str, prefix: str, args: list[str]) -> None:
         self._file = file
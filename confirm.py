@@ -0,0 +1,110 @@
+import asyncio
+import logging
+
+from device import Device
+from hubitat import Hubitat
+
+# hubitat command => candidate (attribute, expected value) pairs, the first attribute the device has is used
+EXPECTED_STATES: dict[str, list[tuple[str, str]]] = {
+    "on": [("switch", "on")],
+    "off": [("switch", "off")],
+    "open": [("door", "open"), ("valve", "open"), ("windowShade", "open"), ("contact", "open")],
+    "close": [("door", "closed"), ("valve", "closed"), ("windowShade", "closed"), ("contact", "closed")],
+    "lock": [("lock", "locked")],
+    "unlock": [("lock", "unlocked")],
+    "setLevel": [("level", "{}")],
+}
+
+
+class Waiter:
+    def __init__(self, attribute: str, value: str, future: asyncio.Future):
+        self.attribute: str = attribute
+        self.value: str = value
+        self.future: asyncio.Future = future
+
+
+class StateConfirmer:
+    # Waits for devices to report the state a command asked for. All in-flight confirmations share
+    # one dispatcher: a single poll loop (with backoff) requests the status of each device that has
+    # waiters, once per round, no matter how many commands are waiting on it. With many devices waiting,
+    # a round is a single request for the state of all devices instead. Polls count against the hub rate limit.
+    def __init__(self, conf: dict, hubitat: Hubitat):
+        self.hubitat = hubitat
+        self.enabled: bool = bool(conf["confirm_commands"])
+        self.timeout: float = float(conf["confirm_timeout"])
+        self._min_delay: float = 0.25
+        self._max_delay: float = 2.0
+        self._bulk_devices: int = 3  # from that many devices waiting, one request for all devices is cheaper
+        self._delay: float = self._min_delay
+        self._waiters: dict[int, list[Waiter]] = {}
+        self._task: asyncio.Task | None = None
+
+    def get_expected_state(self, device: Device, command: str, argument=None) -> tuple[str, str] | None:
+        for attribute, value in EXPECTED_STATES.get(command, []):
+            if attribute in device.attributes:
+                return attribute, value.format(argument)
+        return None
+
+    async def wait_for(self, device_id: int, attribute: str, value: str) -> bool:
+        waiter = Waiter(attribute, value, asyncio.get_running_loop().create_future())
+        self._waiters.setdefault(device_id, []).append(waiter)
+        self._delay = self._min_delay
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.__poll__())
+        try:
+            await asyncio.wait_for(waiter.future, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(device_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(device_id, None)
+
+    def on_event(self, device_id: int, attribute: str, value) -> None:
+        # entry point for device attribute changes, whichever way they are received
+        for waiter in self._waiters.get(device_id, []):
+            if waiter.attribute == attribute and not waiter.future.done() and self.__matches__(waiter.value, value):
+                waiter.future.set_result(value)
+
+    def __matches__(self, expected: str, actual) -> bool:
+        if str(actual) == expected:
+            return True
+        try:
+            return float(actual) == float(expected)
+        except (TypeError, ValueError):
+            return False
+
+    async def __poll__(self) -> None:
+        while self._waiters:
+            await asyncio.sleep(self._delay)
+            self._delay = min(self._delay * 2, self._max_delay)
+            device_ids = list(self._waiters.keys())
+            if len(device_ids) >= self._bulk_devices:
+                await self.__poll_all__()
+                continue
+            for device_id in device_ids:
+                if not self.hubitat.hub_limiter.try_acquire():
+                    break  # the hub is busy: skip this round
+                try:
+                    status = await asyncio.to_thread(self.hubitat.api.device_status, device_id)
+                except Exception as e:
+                    logging.warning(f"Unable to get status of device {device_id} for confirmation: {e}")
+                    continue
+                for attribute, v in status.items():
+                    self.on_event(device_id, attribute, v["currentValue"])
+
+    async def __poll_all__(self) -> None:
+        if not self.hubitat.hub_limiter.try_acquire():
+            return
+        try:
+            inventory = await asyncio.to_thread(self.hubitat.api.list_devices_detailed)
+        except Exception as e:
+            logging.warning(f"Unable to get status of devices for confirmation: {e}")
+            return
+        for device in self.hubitat.apply_device_states(inventory):
+            if device.id in self._waiters:
+                for attribute, value in device.attributes.items():
+                    self.on_event(device.id, attribute, value)
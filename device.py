@@ -1,3 +1,4 @@
+from datetime import datetime
 import logging
 import re
 
@@ -8,9 +9,24 @@ class Device:
         self.label: str = device["label"]
         self.type: str = device["type"]
         self.commands: list[str] = [c["command"] for c in device["commands"]]
+        self.attributes: dict[str, str] = {}
+        self.last_activity: datetime | None = None
+        self.update_attributes(device)
         self.description: str = ""
         self.supported_commands: set[str] = set()
 
+    def update_attributes(self, device: dict) -> None:
+        # devices/all returns attributes as {name: value}; devices/<id> as a list of {name, currentValue, dataType}
+        attributes = device.get("attributes") or {}
+        if isinstance(attributes, list):
+            attributes = {a["name"]: a.get("currentValue") for a in attributes if "name" in a}
+        self.attributes = attributes
+        # devices/all also returns the last activity, e.g. 2022-02-03T04:02:32+0000
+        try:
+            self.last_activity = datetime.fromisoformat(device["date"])
+        except (KeyError, TypeError, ValueError):
+            self.last_activity = None
+
     def __eq__(self, other):
         return isinstance(other, type(self)) and self.id == other.id
 
@@ -0,0 +1,101 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import logging
+import time
+from typing import Awaitable, Callable
+
+from device import Device
+from hubitat import Hubitat
+
+
+class HealthMonitor:
+    # Periodically fetches the state of all devices in one request. Its duration is the hub's round-trip
+    # latency, kept over a rolling window, and its last activity dates tell which devices went quiet.
+    def __init__(self, conf: dict, hubitat: Hubitat, alert_user_ids: list[int]):
+        self.hubitat = hubitat
+        self.enabled: bool = bool(conf["enabled"])
+        self.alert_user_ids: list[int] = alert_user_ids
+        self._interval: float = float(conf["interval"])
+        self._quiet: timedelta = timedelta(hours=float(conf["quiet_hours"]))
+        self._slow_ms: float = float(conf["slow_ms"])
+        self.latencies: deque[float | None] = deque(maxlen=int(conf["window"]))  # in ms, None for failures
+        self.last_check: datetime | None = None
+        self.last_error: str = ""
+        self.quiet_devices: list[Device] = []
+        self._slow: bool = False
+        self._seeded: bool = False  # devices already quiet at start up are not alerted on
+        self._task: asyncio.Task | None = None
+        self._alert: Callable[[str], Awaitable[None]] | None = None
+
+    def start(self, alert: Callable[[str], Awaitable[None]]) -> None:
+        if self.enabled and self._task is None:
+            self._alert = alert
+            self._task = asyncio.get_running_loop().create_task(self.__run__())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def __run__(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logging.error("Health check failed.", exc_info=e)
+            await asyncio.sleep(self._interval)
+
+    async def check(self) -> None:
+        was_reachable = not self.latencies or self.latencies[-1] is not None
+        previous_quiet = {device.id for device in self.quiet_devices}
+        start = time.perf_counter()
+        try:
+            # only the request runs in a worker thread: the devices cache is updated on the event loop
+            inventory = await asyncio.to_thread(self.hubitat.api.list_devices_detailed)
+        except Exception as e:
+            self.latencies.append(None)
+            self.last_check = datetime.now(timezone.utc)
+            self.last_error = str(e)
+            logging.error(f"Hub health check: hub unreachable: {e}")
+            if was_reachable:
+                await self.__alert__(f"Hubitat is unreachable: {e}")
+            return
+        latency = (time.perf_counter() - start) * 1000
+        devices = self.hubitat.apply_device_states(inventory)
+        self.latencies.append(latency)
+        self.last_check = datetime.now(timezone.utc)
+        self.last_error = ""
+        logging.debug(f"Hub health check: {latency:.0f}ms")
+        # alerts on changes only, not on every check while the hub stays slow
+        was_slow, self._slow = self._slow, latency > self._slow_ms
+        if not was_reachable:
+            await self.__alert__(f"Hubitat is reachable again ({latency:.0f}ms).")
+        elif self._slow and not was_slow:
+            await self.__alert__(f"Hubitat is slow: {latency:.0f}ms to list devices.")
+        elif was_slow and not self._slow:
+            await self.__alert__(f"Hubitat is back to normal: {latency:.0f}ms to list devices.")
+
+        cutoff = self.last_check - self._quiet
+        self.quiet_devices = sorted(device for device in devices if device.last_activity and device.last_activity < cutoff)
+        newly_quiet = [device.label for device in self.quiet_devices if device.id not in previous_quiet]
+        if not self._seeded:
+            self._seeded = True
+            if newly_quiet:
+                logging.info(f"Hub health check: quiet devices: {', '.join(newly_quiet)}")
+        elif newly_quiet:
+            await self.__alert__(f"No activity for more than {self._quiet.total_seconds() / 3600:g} hours: {', '.join(newly_quiet)}.")
+
+    async def __alert__(self, text: str) -> None:
+        if self._alert and self.alert_user_ids:
+            await self._alert(text)
+
+    def get_latency_stats(self) -> dict[str, str]:
+        successes = sorted(latency for latency in self.latencies if latency is not None)
+        stats = {"checks": str(len(self.latencies)), "failures": str(len(self.latencies) - len(successes))}
+        if successes:
+            stats["last"] = f"{self.latencies[-1]:.0f}ms" if self.latencies[-1] is not None else "failed"
+            stats["average"] = f"{sum(successes) / len(successes):.0f}ms"
+            stats["p95"] = f"{successes[min(len(successes) - 1, int(len(successes) * 0.95))]:.0f}ms"
+            stats["max"] = f"{successes[-1]:.0f}ms"
+        return stats
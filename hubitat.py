@@ -1,25 +1,34 @@
 from aliases import Aliases
 from device import Device, DeviceGroup
 import logging
+from ratelimit import RateLimiter
+from state import StateBackend
+import time
 
 # https://github.com/danielorf/pyhubitat
 from pyhubitat import MakerAPI
 
 
 class Hubitat:
-    def __init__(self, conf: dict):
+    def __init__(self, conf: dict, state: StateBackend):
         hub = f"{conf['url'].rstrip('/')}/apps/api/{conf['appid']}"
         if hub == "http://ipaddress/apps/api/0":
             raise ValueError("Hubitat's address and app ID must be set")
         logging.info(f"Connecting to hubitat Maker API app {hub}")
         self.api = MakerAPI(conf["token"], hub)
+        self.state = state
+        self._inventory_version: float | None = None
+        self.generation: int = 0  # incremented each time the devices cache is rebuilt
         self.device_groups: dict[str, DeviceGroup] = {}
         self._devices_cache: list[Device] | None = None
         self.case_insensitive: bool = bool(conf["case_insensitive"])
         self._aliases = Aliases(conf["aliases"], self.case_insensitive)
         self._device_descriptions: dict[int, str] = conf["device_descriptions"]
         self.he_to_bot_commands = {"on": None, "off": None, "setLevel": "/dim", "open": None, "close": None, "lock": None, "unlock": None}
-        self._device_name_separator: str = conf["device_name_separator"]
+        self.device_name_separator: str = conf["device_name_separator"]
+        self.low_battery_threshold: int = int(conf["low_battery_threshold"])
+        self.device_limiter = RateLimiter("device", *conf["device_rate_limit"])
+        self.hub_limiter = RateLimiter("hub", *conf["hub_rate_limit"])
         # because Python doesn't support case insensitive searches
         # and Hubitats requires exact case, we create a dict{lowercase,requestedcase}
         self.hsm_arm: dict[str, str] = {x.lower(): x for x in conf["hsm_arm_values"]}
@@ -36,7 +45,7 @@ class Hubitat:
 
     def resolve_devices(self, names: str, device_groups: list[DeviceGroup]) -> set[Device]:
         devices = set()
-        for name in names.split(self._device_name_separator):
+        for name in names.split(self.device_name_separator):
             name = name.strip()
             if not name:
                 continue
@@ -60,10 +69,36 @@ class Hubitat:
         return name
 
     def refresh_devices(self) -> None:
+        self.state.delete("inventory")
+        self.state.delete("inventory_version")
+        self.reload_devices()
+
+    def reload_devices(self) -> None:
+        # drops local caches; the inventory is reloaded from the shared state, or the hub if not there
         self._devices_cache = None
         for g in self.device_groups.values():
             g.refresh_devices()
 
+    def load_inventory(self, inventory: list[dict]) -> None:
+        # replaces the inventory with one fetched from the hub, e.g. in the background
+        self.__publish_inventory__(inventory)
+        self.reload_devices()
+        self.__load_devices__(inventory)
+
+    def warm_up(self) -> None:
+        # standby instances mirror the inventory published by the leader, without talking to the hub
+        version = self.state.get("inventory_version")
+        if version is None or version == self._inventory_version:
+            return
+        inventory = self.state.get("inventory")
+        if inventory is None:
+            return  # being refreshed by the leader
+        logging.debug(f"Reloading inventory version {version}")
+        self.reload_devices()
+        self.__load_devices__(inventory)
+        for g in self.device_groups.values():
+            g.get_devices()
+
     def get_device_group(self, name: str) -> DeviceGroup:
         return self.device_groups[name]
 
@@ -72,14 +107,49 @@ class Hubitat:
 
     def get_all_devices(self) -> list[Device]:
         if self._devices_cache is None:
-            logging.info("Refreshing all devices cache")
-            self._devices_cache = [Device(x) for x in self.api.list_devices_detailed()]
+            inventory = self.state.get("inventory")
+            if inventory is None:
+                logging.info("Refreshing all devices cache")
+                inventory = self.api.list_devices_detailed()
+                self.__publish_inventory__(inventory)
+            self.__load_devices__(inventory)
+
+        return self._devices_cache
 
-            for device in self._devices_cache:
-                device.description = self._device_descriptions.get(device.id, "")
+    def __publish_inventory__(self, inventory: list[dict]) -> None:
+        self.state.set("inventory", inventory)
+        self.state.set("inventory_version", time.time())
+
+    def __load_devices__(self, inventory: list[dict]) -> list[Device]:
+        self._inventory_version = self.state.get("inventory_version")
+        self._devices_cache = [Device(x) for x in inventory]
+        self.generation += 1
+
+        for device in self._devices_cache:
+            device.description = self._device_descriptions.get(device.id, "")
 
         return self._devices_cache
 
+    def refresh_device_states(self) -> list[Device]:
+        # one bulk call to update the current attributes of all devices
+        return self.apply_device_states(self.api.list_devices_detailed())
+
+    def apply_device_states(self, inventory: list[dict]) -> list[Device]:
+        if self._devices_cache is None:
+            # cold cache: the bulk response is the inventory, no need for a second request
+            logging.info("Refreshing all devices cache")
+            self.__publish_inventory__(inventory)
+            return list(self.__load_devices__(inventory))
+
+        # warm cache: update the devices in place, without invalidating the device groups
+        devices = {device.id: device for device in self._devices_cache}
+        self.state.set("inventory", inventory)
+        for x in inventory:
+            device = devices.get(int(x["id"]), None)
+            if device:
+                device.update_attributes(x)
+        return list(devices.values())
+
     def __get_devices(self, name: str, groups: list[DeviceGroup]) -> set[Device]:
         devices = set()
         for group in groups:
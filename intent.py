@@ -0,0 +1,79 @@
+import re
+from typing import Callable
+
+from accesslevel import AccessLevel
+
+# One grammar for all the supported sentences, compiled once.
+# For example: "turn on kitchen and hallway", "switch the porch off", "dim bedroom to 30%", "lock front door".
+_GRAMMAR = re.compile(
+    r"^\s*(?:please\s+)?(?:"
+    r"(?:turn|switch)\s+(?P<switch>on|off)\s+(?P<switch_targets>.+?)"
+    r"|(?:turn|switch)\s+(?P<switch_targets_before>.+?)\s+(?P<switch_after>on|off)"
+    r"|(?P<verb>open|close|lock|unlock)\s+(?P<verb_targets>.+?)"
+    r"|(?:dim|set)\s+(?P<dim_targets>.+?)\s+(?:to\s+)?(?P<level>\d{1,3})\s*%?"
+    r")(?:\s+please)?[\s.!]*$",
+    re.IGNORECASE,
+)
+
+# Keeps the separators, so that spans of parts can be rejoined as they were typed
+_SEPARATORS = re.compile(r"(\s*(?:,|&|\band\b)\s*)", re.IGNORECASE)
+
+_ARTICLE = re.compile(r"^(?:the|my)\s+", re.IGNORECASE)
+
+# bot command => (hubitat command, message, access level); same as the equivalent /commands
+ACTIONS: dict[str, tuple[str, str, AccessLevel]] = {
+    "/on": ("on", "Turned on {}.", AccessLevel.DEVICE),
+    "/off": ("off", "Turned off {}.", AccessLevel.DEVICE),
+    "/open": ("open", "Opened {}.", AccessLevel.DEVICE),
+    "/close": ("close", "Closed {}.", AccessLevel.DEVICE),
+    "/lock": ("lock", "Locked {}.", AccessLevel.SECURITY),
+    "/unlock": ("unlock", "Unlocked {}.", AccessLevel.SECURITY),
+}
+
+
+class Intent:
+    def __init__(self, bot_command: str, names: list[str], level: int | None = None):
+        self.bot_command: str = bot_command
+        self.names: list[str] = names
+        self.level: int | None = level
+
+
+class IntentMatcher:
+    # Built once per inventory generation: device labels are looked up in a set instead of being scanned for each message
+    def __init__(self, labels: list[str], case_hack: Callable[[str], str], generation: int):
+        self._case_hack = case_hack
+        self._labels: set[str] = {case_hack(label) for label in labels}
+        self.generation: int = generation
+
+    def match(self, text: str) -> Intent | None:
+        match = _GRAMMAR.match(text)
+        if not match:
+            return None
+        groups = match.groupdict()
+        if groups["switch"]:
+            return Intent("/" + groups["switch"].lower(), self.split_targets(groups["switch_targets"]))
+        if groups["switch_after"]:
+            return Intent("/" + groups["switch_after"].lower(), self.split_targets(groups["switch_targets_before"]))
+        if groups["verb"]:
+            return Intent("/" + groups["verb"].lower(), self.split_targets(groups["verb_targets"]))
+        return Intent("/dim", self.split_targets(groups["dim_targets"]), int(groups["level"]))
+
+    def split_targets(self, targets: str) -> list[str]:
+        # "kitchen and hallway" is two devices, unless a device is actually called "kitchen and hallway"
+        tokens = _SEPARATORS.split(targets.strip())
+        parts = tokens[0::2]
+        names = []
+        i = 0
+        while i < len(parts):
+            # longest span of parts that is a known device label, otherwise the single part
+            j = len(parts)
+            while j > i + 1 and self.__clean__("".join(tokens[2 * i : 2 * j - 1])) not in self._labels:
+                j -= 1
+            name = self.__clean__("".join(tokens[2 * i : 2 * j - 1]))
+            if name:
+                names.append(name)
+            i = j
+        return names
+
+    def __clean__(self, name: str) -> str:
+        return self._case_hack(_ARTICLE.sub("", name.strip()))
@@ -1,53 +1,85 @@
 #! /usr/bin/env python3
 
+import asyncio
+from audit import AuditEntry, AuditLog
+from confirm import StateConfirmer
+from contextlib import contextmanager
 from datetime import datetime
 from device import Device, DeviceGroup
+from health import HealthMonitor
 from hubitat import Hubitat
+from intent import ACTIONS, IntentMatcher
+from prefetch import Prefetcher
+from profiler import Profiler
+from render import AUDIT_ROW, EVENTS_ROW, PROFILE_ROW, SUMMARY_ROW, USERS_ROW, Renderer, markdown_escape
+from state import LeaderElection, StateBackend, create_state_backend
 import logging
 import platform
 import pytz  # timezones
 import re
 import sys
 import threading
+import time
 
 # https://github.com/python-telegram-bot/python-telegram-bot
-from telegram import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
 from telegram.constants import ParseMode
-from telegram.ext import CallbackContext, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+from telegram.ext import Application, CallbackContext, CallbackQueryHandler, CommandHandler, MessageHandler, filters
 
 from accesslevel import AccessLevel
 from telegram_wrapper import Telegram, TelegramUser
-from typing import Union
+from typing import Iterator, Union
 from config import Config
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
 
 class HubiBot:
-    def __init__(self, telegram: Telegram, hubitat: Hubitat, default_timezone: str):
+    def __init__(
+        self,
+        telegram: Telegram,
+        hubitat: Hubitat,
+        default_timezone: str,
+        audit_log: AuditLog,
+        prefetcher: Prefetcher,
+        state: StateBackend,
+        leader: LeaderElection,
+        confirmer: StateConfirmer,
+        profiler: Profiler,
+        health: HealthMonitor,
+    ):
         self.telegram = telegram
         self.hubitat = hubitat
         self.default_timezone = default_timezone
+        self.audit_log = audit_log
+        self.prefetcher = prefetcher
+        self.state = state
+        self.leader = leader
+        self.confirmer = confirmer
+        self.profiler = profiler
+        self.renderer = Renderer(lambda: self.hubitat.generation)
+        self.health = health
+        self._intent_matcher: IntentMatcher | None = None
         self.list_commands = {AccessLevel.NONE: [], AccessLevel.DEVICE: ["*Device commands*:"], AccessLevel.ADMIN: ["*Admin commands*:"], AccessLevel.SECURITY: ["*Security commands*:"]}
 
-    async def send_text(self, update: Update, context: CallbackContext, text: Union[str, list[str]]) -> None:
-        await self.send_text_or_list(update, context, text, None)
+    async def send_text(self, update: Update, context: CallbackContext, text: Union[str, list[str]]) -> Message | None:
+        return await self.send_text_or_list(update, context, text, None)
 
     async def send_md(self, update: Update, context: CallbackContext, text: Union[str, list[str]]) -> None:
         await self.send_text_or_list(update, context, text, ParseMode.MARKDOWN)
 
-    async def send_text_or_list(self, update: Update, context: CallbackContext, text: Union[str, list[str]], parse_mode: str | None) -> None:
+    async def send_text_or_list(self, update: Update, context: CallbackContext, text: Union[str, list[str]], parse_mode: str | None) -> Message | None:
         if not text:
-            return
+            return None
         if isinstance(text, list):
             text = "\n".join(text)
         chat_id = update.effective_chat.id if update.effective_chat else None
         try:
-            await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            return await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
         except Exception as e:
             if parse_mode == ParseMode.MARKDOWN:
                 logging.error(f"Unable to send message; possibly Markdown issue due to caller not using markdown_escape(). Trying again with formatting disabled.", exc_info=e)
-                await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=None)
+                return await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=None)
             else:
                 raise
 
@@ -66,8 +98,9 @@ class HubiBot:
     def get_single_arg(self, context: CallbackContext) -> str:
         return "" if not context.args else self.hubitat.case_hack(" ".join(context.args))
 
-    async def get_devices(self, update: Update, context: CallbackContext) -> set[Device]:
-        device_name = self.get_single_arg(context)
+    async def get_devices(self, update: Update, context: CallbackContext, device_name: str | None = None) -> set[Device]:
+        if device_name is None:
+            device_name = self.get_single_arg(context)
         if not device_name:
             await self.send_text(update, context, "Device name not specified.")
             return set()
@@ -76,23 +109,20 @@ class HubiBot:
 
         if not devices:
             await self.send_text(update, context, "Device not found. '/l' to get list of devices.")
+        else:
+            self.prefetcher.record_access(self.get_user(update).id, [device.id for device in devices])
 
         return devices
 
     def markdown_escape(self, text: str) -> str:
-        if not text:
-            return ""
-        text = re.sub(r"([_*\[\]()~`>\#\+\-=|\.!])", r"\\\1", text)
-        text = re.sub(r"\\\\([_*\[\]()~`>\#\+\-=|\.!])", r"\1", text)
-        return text
+        return markdown_escape(text)
 
-    def get_timezone(self, context: CallbackContext) -> str:
-        return context.user_data.get("tz", "") if context.user_data else ""
+    def get_timezone(self, update: Update) -> str:
+        # kept in the shared state so that it survives a fail over to another instance
+        return self.state.get(f"user:{self.get_user(update).id}:tz") or ""
 
-    def set_timezone(self, context: CallbackContext, value: str) -> None:
-        if not context.user_data:
-            context.user_data = {}
-        context.user_data["tz"] = value
+    def set_timezone(self, update: Update, value: str) -> None:
+        self.state.set(f"user:{self.get_user(update).id}:tz", value)
 
     def get_user(self, update: Update) -> TelegramUser:
         if not update.effective_user:
@@ -113,59 +143,244 @@ class HubiBot:
             command = command + " " + device.label
         logging.info(f"{self.get_user_info(update)} is sending command: {command}")
 
+    @contextmanager
+    def audited(self, update: Update, command: str, device: Device | None = None) -> Iterator[None]:
+        # logs the command, then journals its outcome and latency in the audit log
+        self.log_command(update, command, device)
+        outcome = "ok"
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            outcome = f"error: {type(e).__name__}"
+            raise
+        finally:
+            self.audit(update, command, device, outcome, (time.perf_counter() - start) * 1000)
+
+    def audit(self, update: Update, command: str, device: Device | None, outcome: str, latency_ms: float = 0) -> None:
+        user = update.effective_user
+        entry = AuditEntry(time.time(), user.id if user else -1, user.name if user else "", command, device.id if device else None, device.label if device else "", outcome, latency_ms)
+        self.audit_log.record(entry)
+
+    def get_command_text(self, update: Update) -> str:
+        # what the user sent: a /command, a plain text message or a button press
+        if update.callback_query:
+            return f"button {update.callback_query.data}"
+        if update.effective_message and update.effective_message.text:
+            return update.effective_message.text[:64]
+        return ""
+
     async def request_access(self, update: Update, context: CallbackContext, access_level: AccessLevel) -> None:
         if not self.has_access(update, access_level):
+            self.audit(update, self.get_command_text(update), None, "denied")
             # user attempting to use admin/device/security command without perm, pretend it doesn't exist
             await self.command_unknown(update, context)
             raise PermissionError(f"{self.get_user_info(update)} is attempting level {access_level} command without permission.")
 
-    async def device_actuator(self, update: Update, context: CallbackContext, command: Union[str, list], bot_command: str, message: str, access_level=AccessLevel.DEVICE) -> None:
+    async def throttle(self, update: Update, context: CallbackContext, command: str) -> bool:
+        # to be called once per bot command, before its first request to the hub; returns True (and tells the user) if the command must not be sent
+        user = self.get_user(update)
+        if not self.telegram.user_limiter.try_acquire(user.id, *user.rate_limit):
+            message = "Slow down: too many commands. Try again in a moment."
+        elif not self.hubitat.hub_limiter.try_acquire():
+            self.telegram.user_limiter.refund(user.id)
+            message = "Slow down: the hub is busy. Try again in a moment."
+        else:
+            return False
+        await self.send_throttled(update, context, command, None, message)
+        return True
+
+    def refund(self, update: Update) -> None:
+        # gives back what throttle() took, for a command that didn't reach the hub after all
+        self.telegram.user_limiter.refund(self.get_user(update).id)
+        self.hubitat.hub_limiter.refund()
+
+    async def throttle_device(self, update: Update, context: CallbackContext, command: str, device: Device) -> bool:
+        # for commands changing the state of a device, which only accepts that many per minute
+        if self.hubitat.device_limiter.try_acquire(device.id):
+            return False
+        await self.send_throttled(update, context, command, device, f"Slow down: too many commands for {device.label}. Try again in a moment.")
+        return True
+
+    async def send_throttled(self, update: Update, context: CallbackContext, command: str, device: Device | None, message: str) -> None:
+        logging.warning(f"Throttling {self.get_user_info(update)}: {message}")
+        self.audit(update, command, device, "throttled")
+        await self.send_text(update, context, message)
+
+    async def device_actuator(
+        self, update: Update, context: CallbackContext, command: Union[str, list], bot_command: str, message: str, access_level=AccessLevel.DEVICE, device_name: str | None = None
+    ) -> None:
         await self.request_access(update, context, access_level)
-        for device in await self.get_devices(update, context):
+        hub_command, argument = (command[0], command[1]) if isinstance(command, list) else (command, None)
+        charged = False
+        sent = False
+        for device in await self.get_devices(update, context, device_name):
             supported_commands = device.supported_commands
             if bot_command not in supported_commands:
                 await self.send_md(update, context, f"Command {bot_command} not supported by device `{device.label}`.")
                 await self.send_md(update, context, f"Supported commands are: `{ '`, `'.join(supported_commands) }`.")
+                self.audit(update, bot_command, device, "unsupported")
                 continue
-            self.log_command(update, bot_command, device)
-            if isinstance(command, list):
-                self.hubitat.api.send_command(device.id, command[0], command[1])
+            if not charged:
+                if await self.throttle(update, context, bot_command):
+                    return
+                charged = True
+            if await self.throttle_device(update, context, bot_command, device):
+                continue
+            with self.audited(update, bot_command, device):
+                sent = True
+                if argument is not None:
+                    self.hubitat.api.send_command(device.id, hub_command, argument)
+                else:
+                    self.hubitat.api.send_command(device.id, hub_command)
+            self.prefetcher.invalidate(device.id)
+            expected = self.confirmer.get_expected_state(device, hub_command, argument) if self.confirmer.enabled else None
+            if expected:
+                # the handler doesn't wait for the device: updates are processed one at a time, so that would hold up all users
+                reply = await self.send_text(update, context, f"Sent {bot_command} to {device.label}, waiting for its {expected[0]} to be {expected[1]}.")
+                context.application.create_task(self.confirm(update, context, device, bot_command, message, expected, reply), update=update)
             else:
-                self.hubitat.api.send_command(device.id, command)
-            await self.send_text(update, context, message.format(device.label))
+                await self.send_text(update, context, message.format(device.label))
+        if charged and not sent:
+            # all the devices were throttled: no prefetching either for a user told to slow down
+            self.refund(update)
+            return
+        self.prefetcher.prefetch(self.get_user(update).id)
+
+    async def confirm(self, update: Update, context: CallbackContext, device: Device, bot_command: str, message: str, expected: tuple[str, str], sent: Message | None) -> None:
+        attribute, value = expected
+        if await self.confirmer.wait_for(device.id, attribute, value):
+            text = f"{message.format(device.label)} Confirmed {attribute} is {value}."
+        else:
+            text = f"Sent {bot_command} to {device.label}, but its {attribute} is not {value} after {self.confirmer.timeout:g}s."
+        if sent:
+            await sent.edit_text(text)
+        else:
+            await self.send_text(update, context, text)
 
     async def command_device_info(self, update: Update, context: CallbackContext) -> None:
         await self.request_access(update, context, AccessLevel.DEVICE)
+        charged = False
         for device in await self.get_devices(update, context):
-            info = self.hubitat.api.get_device_info(device.id)
-            self.log_command(update, "/info", device)
+            info = self.prefetcher.get_cached("info", device.id)
+            if info is None and not charged:
+                # only requests that reach the hub count against the rate limits
+                if await self.throttle(update, context, "/info"):
+                    return
+                charged = True
+            with self.audited(update, "/info", device):
+                info = dict(info) if info is not None else self.hubitat.api.get_device_info(device.id)
             info["supported_commands"] = ", ".join(device.supported_commands)
             if not self.has_access(update, AccessLevel.ADMIN):
                 info = {"label": info["label"], "supported_commands": info["supported_commands"]}
             if device.description:
                 info["description"] = device.description
             await self.send_md(update, context, [f"*{k}*: `{v}`" for k, v in info.items()])
+        self.prefetcher.prefetch(self.get_user(update).id)
 
     async def command_refresh(self, update: Update, context: CallbackContext) -> None:
         await self.request_access(update, context, AccessLevel.ADMIN)
         self.hubitat.refresh_devices()
+        self.prefetcher.clear()
         await self.send_text(update, context, "Refresh completed.")
 
+    async def command_stats(self, update: Update, context: CallbackContext) -> None:
+        await self.request_access(update, context, AccessLevel.ADMIN)
+        text = [f"*Instance*: `{self.leader.owner}`", "*Prefetch*:"]
+        text += [f"{k}: `{v}`" for k, v in self.prefetcher.get_stats().items()]
+        text.append("*Rate limiting*:")
+        for limiter in [self.telegram.user_limiter, self.hubitat.device_limiter, self.hubitat.hub_limiter]:
+            text.append(f"{limiter.name}: `{limiter.throttled}` throttled, `{limiter.active_keys()}` active")
+        await self.send_md(update, context, text)
+
+    def get_intent_matcher(self) -> IntentMatcher:
+        devices = self.hubitat.get_all_devices()
+        if self._intent_matcher is None or self._intent_matcher.generation != self.hubitat.generation:
+            self._intent_matcher = IntentMatcher([device.label for device in devices], self.hubitat.case_hack, self.hubitat.generation)
+        return self._intent_matcher
+
     async def command_text(self, update: Update, context: CallbackContext) -> None:
-        # TODO: make it more interesting by consuming update.message.text
-        await self.command_help(update, context)
+        # plain sentences such as "turn off kitchen and hallway" or "dim bedroom to 30"
+        intent = self.get_intent_matcher().match(update.message.text) if update.message and update.message.text else None
+        if not intent or not intent.names:
+            await self.command_help(update, context)
+            return
+        device_name = self.hubitat.device_name_separator.join(intent.names)
+        if intent.level is not None:
+            percent = self.get_percent(str(intent.level))
+            if percent is None:
+                await self.send_text(update, context, "Invalid dim level specified: must be an int between 0 and 100.")
+                return
+            await self.device_actuator(update, context, ["setLevel", percent], "/dim", "Dimmed {} to " + str(percent) + "%", device_name=device_name)
+            return
+        await self.device_action(update, context, intent.bot_command, device_name)
 
     async def command_device_status(self, update: Update, context: CallbackContext) -> None:
         await self.request_access(update, context, AccessLevel.DEVICE)
+        charged = False
         for device in await self.get_devices(update, context):
-            self.log_command(update, "/status", device)
-            status = self.hubitat.api.device_status(device.id)
+            status = self.prefetcher.get_cached("status", device.id)
+            if status is None and not charged:
+                if await self.throttle(update, context, "/status"):
+                    return
+                charged = True
+            with self.audited(update, "/status", device):
+                if status is None:
+                    status = self.hubitat.api.device_status(device.id)
             text = [f"Status for *{device.label}*:"]
             if self.has_access(update, AccessLevel.ADMIN):
                 text += [f"*{k}*: `{v['currentValue']}` ({v['dataType']})" for k, v in status.items() if v["dataType"] != "JSON_OBJECT"]
             else:
                 text += [f"*{k}*: `{v['currentValue']}`" for k, v in status.items() if v["dataType"] != "JSON_OBJECT"]
             await self.send_md(update, context, text)
+        self.prefetcher.prefetch(self.get_user(update).id)
+
+    async def command_device_summary(self, update: Update, context: CallbackContext) -> None:
+        await self.request_access(update, context, AccessLevel.DEVICE)
+        device_groups: list[DeviceGroup] = self.get_user(update).device_groups
+        device_filter: str = self.get_single_arg(context)
+        if await self.throttle(update, context, "/summary"):
+            return
+        # one bulk request to the hub for the state of all devices, instead of one per device
+        with self.audited(update, "/summary " + device_filter):
+            self.hubitat.refresh_device_states()
+
+        groups = [group for group in device_groups if device_filter and device_filter == self.hubitat.case_hack(group.name)]
+        devices: set[Device] = set()
+        for device_group in groups or device_groups:
+            for device in device_group.get_devices().values():
+                if groups or device_filter in self.hubitat.case_hack(device.label):
+                    devices.add(device)
+
+        def get_battery(device: Device) -> int | None:
+            try:
+                return int(float(device.attributes["battery"]))
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        def is_low_battery(device: Device) -> bool:
+            battery = get_battery(device)
+            return battery is not None and battery < self.hubitat.low_battery_threshold
+
+        categories = [
+            ("Open", lambda d: d.attributes.get("contact") == "open" or d.attributes.get("door") == "open"),
+            ("Unlocked", lambda d: d.attributes.get("lock") == "unlocked"),
+            ("On", lambda d: d.attributes.get("switch") == "on"),
+            ("Wet", lambda d: d.attributes.get("water") == "wet"),
+            ("Motion", lambda d: d.attributes.get("motion") == "active"),
+            (f"Battery<{self.hubitat.low_battery_threshold}%", is_low_battery),
+        ]
+
+        text = [f"Summary for {len(devices)} devices:", "```", SUMMARY_ROW("Category", "Count", "Devices"), "------------|-----|-----------"]
+        for category, predicate in categories:
+            hits = sorted(device for device in devices if predicate(device))
+            if category.startswith("Battery"):
+                names = ", ".join(f"{d.label} ({get_battery(d)}%)" for d in hits)
+            else:
+                names = ", ".join(d.label for d in hits)
+            text.append(SUMMARY_ROW(category, len(hits), names.replace("`", "'")))
+        text.append("```")
+        await self.send_md(update, context, text)
 
     def get_matching_timezones(self, input: str) -> list[str]:
         input = input.lower()
@@ -175,7 +390,7 @@ class HubiBot:
         timezone = " ".join(context.args) if context.args else ""
         if timezone:
             if timezone in pytz.all_timezones_set:
-                self.set_timezone(context, timezone)
+                self.set_timezone(update, timezone)
                 await self.send_text(update, context, "Timezone set")
             else:
                 hits = self.get_matching_timezones(timezone)
@@ -184,7 +399,7 @@ class HubiBot:
                 hits = hits[0:10]
                 await self.send_text(update, context, "Invalid timezone. Valid timezones are: " + ", ".join(hits) + ", ...")
         else:
-            timezone = self.get_timezone(context)
+            timezone = self.get_timezone(update)
             if timezone:
                 await self.send_text(update, context, f"User timezone is: {timezone}.")
             else:
@@ -198,15 +413,18 @@ class HubiBot:
 
     async def get_device_events(self, update: Update, context: CallbackContext, last_only: bool) -> None:
         await self.request_access(update, context, AccessLevel.SECURITY)
-        for device in await self.get_devices(update, context):
-            self.log_command(update, "/events", device)
-            events = self.hubitat.api.get_device_events(device.id)
+        devices = await self.get_devices(update, context)
+        if devices and await self.throttle(update, context, "/events"):
+            return
+        for device in devices:
+            with self.audited(update, "/events", device):
+                events = self.hubitat.api.get_device_events(device.id)
 
             if len(events) == 0:
                 await self.send_md(update, context, f"No events for *{device.label}*")
                 continue
 
-            tz_text = self.get_timezone(context)
+            tz_text = self.get_timezone(update)
             if not tz_text:
                 tz_text = self.default_timezone
             tz = pytz.timezone(tz_text)
@@ -216,7 +434,7 @@ class HubiBot:
                 # event_date is a string in ISO 8601 format
                 # e.g. 2022-02-03T04:02:32+0000
                 # start by transforming into a real datetime
-                event_datetime = datetime.strptime(event_date, "%Y-%m-%dT%H:%M:%S%z")
+                event_datetime = datetime.fromisoformat(event_date)
                 # now transform it to the proper tz
                 event_datetime = event_datetime.astimezone(tz)
                 # and ... convert back to string.
@@ -229,19 +447,113 @@ class HubiBot:
                 await self.send_md(update, context, text)
                 continue
 
-            def row(date, name, value) -> str:
-                return f"{date :20}|{name :12}|{value or '':10}"
-
-            text = [f"Events for *{device.label}*, timezone {tz_text}:", "```", row("date", "name", "value")]
-
-            for event in events:
-                event_date = convert_date(event["date"])
-                text.append(row(event_date, event["name"], event["value"]))
+            text = [f"Events for *{device.label}*, timezone {tz_text}:", "```", EVENTS_ROW("date", "name", "value")]
+            text += [EVENTS_ROW(convert_date(event["date"]), event["name"], event["value"] or "") for event in events]
 
             text.append("```")
 
             await self.send_md(update, context, text)
 
+    def get_duration(self, input: str) -> float | None:
+        # e.g. 30m, 12h, 7d
+        units = {"s": 1, "m": 60, "h": 3600, "d": 24 * 3600, "w": 7 * 24 * 3600}
+        match = re.fullmatch(r"(\d+)([smhdw])", input.strip().lower())
+        return int(match.group(1)) * units[match.group(2)] if match else None
+
+    async def command_audit(self, update: Update, context: CallbackContext) -> None:
+        await self.request_access(update, context, AccessLevel.ADMIN)
+        args = list(context.args) if context.args else []
+        since = 0.0
+        if args:
+            duration = self.get_duration(args[-1])
+            if duration is not None:
+                since = time.time() - duration
+                args = args[:-1]
+
+        user_id: int | None = None
+        device_ids: list[int] | None = None
+        target = " ".join(args).strip()
+        if target:
+            try:
+                user_id = int(target)
+            except ValueError:
+                devices = self.hubitat.resolve_devices(self.hubitat.case_hack(target), self.get_user(update).device_groups)
+                if not devices:
+                    await self.send_text(update, context, "Neither a user id nor a device. Usage: /audit [user id|device] [since, e.g. 30m, 12h, 7d]")
+                    return
+                device_ids = [device.id for device in devices]
+
+        if not self.audit_log.enabled:
+            await self.send_text(update, context, "Audit log disabled: set audit_file under main in config.yaml.")
+            return
+        entries = await self.audit_log.query(user_id, device_ids, since)
+        if not entries:
+            await self.send_text(update, context, "No audit entries.")
+            return
+
+        tz_text = self.get_timezone(update) or self.default_timezone
+        tz = pytz.timezone(tz_text)
+
+        text = [f"Audit entries, timezone {self.markdown_escape(tz_text)}:", "```", AUDIT_ROW("date", "user", "command", "device", "outcome", "ms")]
+        for e in entries:
+            date = datetime.fromtimestamp(e.ts, tz).strftime("%Y-%m-%d %H:%M:%S")
+            text.append(AUDIT_ROW(date, e.user_name or e.user_id, e.command, e.device_label, e.outcome, f"{e.latency_ms:.0f}").replace("`", "'"))
+        text.append("```")
+        await self.send_md(update, context, text)
+
+    async def command_profile(self, update: Update, context: CallbackContext) -> None:
+        await self.request_access(update, context, AccessLevel.ADMIN)
+        match self.get_single_arg(context).lower():
+            case "start":
+                if self.profiler.start():
+                    await self.send_text(update, context, "Profiler started. '/profile stop' to get results.")
+                else:
+                    await self.send_text(update, context, "Profiler already running.")
+            case "stop":
+                duration = self.profiler.get_duration()
+                entries, file = self.profiler.stop()
+                if not entries:
+                    await self.send_text(update, context, "Profiler not running.")
+                    return
+
+                text = [f"Top functions over {duration:.0f}s, by own time (seconds):", "```", PROFILE_ROW("calls", "own", "cumul", "function")]
+                text += [PROFILE_ROW(e.calls, f"{e.total_time:.3f}", f"{e.cumulative_time:.3f}", e.function).replace("`", "'") for e in entries]
+                text.append("```")
+                if file:
+                    text.append(f"Full profile saved to `{file}`.")
+                await self.send_md(update, context, text)
+            case _:
+                state = f"running for {self.profiler.get_duration():.0f}s" if self.profiler.is_running() else "not running"
+                await self.send_text(update, context, f"Profiler is {state}. Usage: /profile start|stop")
+
+    async def command_health(self, update: Update, context: CallbackContext) -> None:
+        await self.request_access(update, context, AccessLevel.ADMIN)
+        if self.health.last_check is None:
+            # monitor disabled or first check not done yet
+            if await self.throttle(update, context, "/health"):
+                return
+            await self.health.check()
+
+        tz = pytz.timezone(self.get_timezone(update) or self.default_timezone)
+
+        def format_date(date: datetime | None) -> str:
+            return date.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S") if date else "never"
+
+        text = [f"*Hub* (last check `{format_date(self.health.last_check)}`):"]
+        text += [f"{k}: `{v}`" for k, v in self.health.get_latency_stats().items()]
+        if self.health.last_error:
+            text.append(f"error: {self.markdown_escape(self.health.last_error)}")
+        text.append(f"*Quiet devices*: {len(self.health.quiet_devices)}")
+        text += [f"{self.renderer.escape(device.label)}: `{format_date(device.last_activity)}`" for device in self.health.quiet_devices]
+        await self.send_md(update, context, text)
+
+    async def send_alert(self, text: str) -> None:
+        for user_id in self.health.alert_user_ids:
+            try:
+                await self.telegram.application.bot.send_message(chat_id=user_id, text=text)
+            except Exception as e:
+                logging.error(f"Unable to send alert to user {user_id}.", exc_info=e)
+
     async def command_unknown(self, update: Update, context: CallbackContext) -> None:
         await self.send_text(update, context, "Unknown command.")
         await self.command_help(update, context)
@@ -249,23 +561,14 @@ class HubiBot:
     async def list_devices(self, update: Update, context: CallbackContext, devices: list[Device], title: str | None):
         await self.request_access(update, context, AccessLevel.DEVICE)
         devices_text = []
-
-        def get_description(device: Device) -> str:
-            if device.description:
-                return ": " + self.markdown_escape(device.description)
-            else:
-                return ""
-
         if title:
             devices_text.append(title)
         if not devices:
             devices_text.append("No devices.")
         else:
             devices.sort()
-            if self.has_access(update, AccessLevel.ADMIN):
-                devices_text += [f"{self.markdown_escape(info.label)}: `{info.id}` ({info.type}) {self.markdown_escape(info.description)}" for info in devices]
-            else:
-                devices_text += [f"{self.markdown_escape(info.label)} {get_description(info)}" for info in devices]
+            detailed = self.has_access(update, AccessLevel.ADMIN)
+            devices_text += [self.renderer.device_row(info, detailed) for info in devices]
         await self.send_md(update, context, devices_text)
 
     async def command_list_devices(self, update: Update, context: CallbackContext) -> None:
@@ -307,32 +610,33 @@ class HubiBot:
         logging.error(f"Unknown {self.get_user_info(update)} is attempting to use the bot.")
         await self.send_text(update, context, self.telegram.rejected_message)
 
+    async def device_action(self, update: Update, context: CallbackContext, bot_command: str, device_name: str | None = None) -> None:
+        command, message, access_level = ACTIONS[bot_command]
+        await self.device_actuator(update, context, command, bot_command, message, access_level=access_level, device_name=device_name)
+
     async def command_device_on(self, update: Update, context: CallbackContext) -> None:
-        await self.device_actuator(update, context, "on", "/on", "Turned on {}.")
+        await self.device_action(update, context, "/on")
 
     async def command_device_off(self, update: Update, context: CallbackContext) -> None:
-        await self.device_actuator(update, context, "off", "/off", "Turned off {}.")
+        await self.device_action(update, context, "/off")
 
     async def command_device_open(self, update: Update, context: CallbackContext) -> None:
-        await self.device_actuator(update, context, "open", "/open", "Opened {}.")
+        await self.device_action(update, context, "/open")
 
     async def command_device_close(self, update: Update, context: CallbackContext) -> None:
-        await self.device_actuator(update, context, "close", "/close", "Closed {}.")
+        await self.device_action(update, context, "/close")
 
     async def command_device_lock(self, update: Update, context: CallbackContext) -> None:
-        await self.device_actuator(update, context, "lock", "/lock", "Locked {}.", access_level=AccessLevel.SECURITY)
+        await self.device_action(update, context, "/lock")
 
     async def command_device_unlock(self, update: Update, context: CallbackContext) -> None:
-        await self.device_actuator(update, context, "unlock", "/unlock", "Unlocked {}.", access_level=AccessLevel.SECURITY)
+        await self.device_action(update, context, "/unlock")
 
     async def command_list_users(self, update: Update, context: CallbackContext) -> None:
         await self.request_access(update, context, AccessLevel.ADMIN)
 
-        def row(id, isAdmin, userGroup, deviceGroup) -> str:
-            return f"{id :10}|{isAdmin :5}|{userGroup :10}|{deviceGroup}"
-
-        text = ["```", row("Id", "Level", "UserGroup", "DeviceGroups"), "----------|-----|----------|-----------"]
-        text += [row(u.id, u.access_level, u.user_group, [group.name for group in u.device_groups]) for u in self.telegram.users.values()]
+        text = ["```", USERS_ROW("Id", "Level", "UserGroup", "DeviceGroups"), "----------|-----|----------|-----------"]
+        text += [USERS_ROW(u.id, u.access_level, u.user_group, [group.name for group in u.device_groups]) for u in self.telegram.users.values()]
         text.append("```")
         await self.send_md(update, context, text)
 
@@ -358,14 +662,16 @@ class HubiBot:
 
     async def command_mode(self, update: Update, context: CallbackContext) -> None:
         await self.request_access(update, context, AccessLevel.SECURITY)
+        if await self.throttle(update, context, "/mode"):
+            return
         modes = self.hubitat.api._request_sender("modes").json()
         mode_requested = self.get_single_arg(context)
         if mode_requested:
             # mode change requested
             mode = self.hubitat.resolve_mode(mode_requested, modes)
             if mode:
-                self.log_command(update, f"/mode {mode['name']}")
-                self.hubitat.api._request_sender(f"modes/{mode['id']}")
+                with self.audited(update, f"/mode {mode['name']}"):
+                    self.hubitat.api._request_sender(f"modes/{mode['id']}")
                 await self.send_text(update, context, f"Mode changed to {mode['name']}.")
                 return
             await self.send_text(update, context, "Unknown mode.")
@@ -381,13 +687,15 @@ class HubiBot:
 
     async def command_hsm(self, update: Update, context: CallbackContext) -> None:
         await self.request_access(update, context, AccessLevel.SECURITY)
+        if await self.throttle(update, context, "/arm"):
+            return
         command = self.get_single_arg(context)
         if command:
             # mode change requested
             hsm = self.hubitat.resolve_hsm(command)
             if hsm:
-                self.log_command(update, f"/arm {hsm}")
-                self.hubitat.api._request_sender(f"hsm/{hsm}")
+                with self.audited(update, f"/arm {hsm}"):
+                    self.hubitat.api._request_sender(f"hsm/{hsm}")
                 await self.send_text(update, context, f"Arm request {hsm} sent.")
             else:
                 await self.send_text(update, context, f"Invalid arm state. Supported values: {', '.join(self.hubitat.hsm_arm.values())}.")
@@ -442,17 +750,44 @@ class HubiBot:
     def get_user_filter(self) -> filters.User:
         return filters.User(list(self.telegram.users.keys()))
 
+    async def post_init(self, application: Application) -> None:
+        self.leader.start(application.stop_running)
+        application.create_task(self.refresh_inventory())
+        self.audit_log.start()
+        self.profiler.start_if_configured()
+        self.health.start(self.send_alert)
+
+    async def refresh_inventory(self) -> None:
+        # the inventory mirrored while on standby, or left in the shared state by a previous run, is used until it is refetched
+        try:
+            inventory = await asyncio.to_thread(self.hubitat.api.list_devices_detailed)
+        except Exception as e:
+            logging.error("Unable to refresh the devices inventory.", exc_info=e)
+            return
+        self.hubitat.load_inventory(inventory)
+
+    async def post_shutdown(self, application: Application) -> None:
+        self.health.stop()
+        await self.audit_log.stop()
+        self.leader.stop()
+
     def configure(self) -> None:
         application = self.telegram.application
+        application.post_init = self.post_init
+        application.post_shutdown = self.post_shutdown
 
         # Reject anyone we don't know
         application.add_handler(MessageHandler(~self.get_user_filter(), self.command_unknown_user))
 
+        self.add_command(
+            ["audit"], "get recent commands, optionally filtering by `user` id or device and `since` a duration such as 30m, 12h, 7d", self.command_audit, AccessLevel.ADMIN, params="user|device since"
+        )
         self.add_command(["close"], "close device `name`", self.command_device_close, AccessLevel.DEVICE, params="name")
         self.add_command(["dim", "d", "level"], "set device `name` to `number` percent", self.command_device_dim, AccessLevel.DEVICE, params="number name")
         self.add_command(["events", "e"], "get recent events for device `name`", self.command_device_events, AccessLevel.SECURITY, params="name")
         self.add_command(["exit", "x"], "terminates the robot", self.command_exit, AccessLevel.ADMIN)
         self.add_command(["groups", "g"], "get device groups, optionally filtering name by `filter`", self.command_list_groups, AccessLevel.ADMIN, params="filter")
+        self.add_command(["health"], "get hub latency and devices without recent activity", self.command_health, AccessLevel.ADMIN)
         self.add_command(["help", "h"], "display help", self.command_help, AccessLevel.NONE)  # sadly '/?' is not a valid command
         self.add_command(["arm", "a"], "get hsm arm status or arm to `value`", self.command_hsm, AccessLevel.SECURITY, "value")
         self.add_command(["info", "i"], "get info of device `name`", self.command_device_info, AccessLevel.DEVICE, params="name")
@@ -464,8 +799,11 @@ class HubiBot:
         self.add_command(["off"], "turn off device `name`", self.command_device_off, AccessLevel.DEVICE, params="name")
         self.add_command(["on"], "turn on device `name`", self.command_device_on, AccessLevel.DEVICE, params="name")
         self.add_command(["open"], "open device `name`", self.command_device_open, AccessLevel.DEVICE, params="name")
+        self.add_command(["profile"], "get profiler state, or `start` or `stop` profiling the bot", self.command_profile, AccessLevel.ADMIN, params="start|stop")
         self.add_command(["refresh", "r"], "refresh list of devices", self.command_refresh, AccessLevel.ADMIN)
+        self.add_command(["stats"], "get bot statistics", self.command_stats, AccessLevel.ADMIN)
         self.add_command(["status", "s"], "get status of device `name`", self.command_device_status, AccessLevel.DEVICE, params="name")
+        self.add_command(["summary", "sum"], "get a summary of devices states, optionally filtering by device name or group `filter`", self.command_device_summary, AccessLevel.DEVICE, params="filter")
         self.add_command(["start", "s"], "start command", self.command_start, AccessLevel.NONE)
         self.add_command(["timezone", "tz"], "get timezone or set it to `value`", self.command_timezone, AccessLevel.SECURITY, params="value")
         self.add_command(["unlock"], "unlock device `name`", self.command_device_unlock, AccessLevel.SECURITY, params="name")
@@ -481,6 +819,10 @@ class HubiBot:
         self.list_commands[AccessLevel.ADMIN] += self.list_commands[AccessLevel.SECURITY]
 
     def run(self) -> None:
+        # only the leader polls Telegram and talks to the hub
+        self.leader.wait_for_leadership(self.hubitat.warm_up)
+        # pick up the latest inventory published by the previous leader, if any
+        self.hubitat.warm_up()
         self.telegram.application.run_polling()
 
 
@@ -497,10 +839,27 @@ try:
     logging.getLogger().setLevel(logging.getLevelName(conf["logverbosity"]))
     default_timezone = conf["default_timezone"]
     logging.debug(f"CONFIG: {config}")
-    hubitat = Hubitat(config["hubitat"])
+    state = create_state_backend(config["state"])
+    leader = LeaderElection(state, float(config["state"]["lease_seconds"]))
+    hubitat = Hubitat(config["hubitat"], state)
     telegram = Telegram(config["telegram"], hubitat)
 
-    hal = HubiBot(telegram, hubitat, default_timezone)
+    audit_log = AuditLog(conf)
+
+    prefetcher = Prefetcher(config["prefetch"], hubitat)
+
+    confirmer = StateConfirmer(config["hubitat"], hubitat)
+
+    profiler = Profiler(conf)
+
+    alert_user_groups = config["health"]["alert_user_groups"] or []
+    for group_name in alert_user_groups:
+        if group_name not in config["telegram"]["enabled_user_groups"]:
+            raise ValueError(f"User group '{group_name}' listed in health.alert_user_groups is not enabled.")
+    alert_user_ids = [user.id for user in telegram.users.values() if user.user_group in alert_user_groups]
+    health = HealthMonitor(config["health"], hubitat, alert_user_ids)
+
+    hal = HubiBot(telegram, hubitat, default_timezone, audit_log, prefetcher, state, leader, confirmer, profiler, health)
     hal.configure()
     hal.run()
     logging.warning("Bot shutting down.")
@@ -0,0 +1,140 @@
+import asyncio
+from collections import Counter, deque
+import logging
+import time
+
+from hubitat import Hubitat
+
+
+class AccessHistory:
+    def __init__(self, recent_size: int = 10, frequent_size: int = 50):
+        self.recent: deque[int] = deque(maxlen=recent_size)
+        self.frequent: Counter[int] = Counter()
+        self._frequent_size = frequent_size
+
+    def add(self, device_id: int) -> None:
+        if device_id in self.recent:
+            self.recent.remove(device_id)
+        self.recent.appendleft(device_id)
+        self.frequent[device_id] += 1
+        if len(self.frequent) > 2 * self._frequent_size:
+            self.frequent = Counter(dict(self.frequent.most_common(self._frequent_size)))
+
+    def likely_next(self, count: int) -> list[int]:
+        ret: list[int] = []
+        for device_id in list(self.recent) + [device_id for device_id, _ in self.frequent.most_common(count)]:
+            if device_id not in ret:
+                ret.append(device_id)
+            if len(ret) >= count:
+                break
+        return ret
+
+
+class Prefetcher:
+    # Speculatively fetches device status & info for the devices a user is likely to ask about next,
+    # into a short-lived cache. Prefetching is bounded by a hub request budget per minute.
+    def __init__(self, conf: dict, hubitat: Hubitat):
+        self.hubitat = hubitat
+        self.enabled: bool = bool(conf["enabled"])
+        self._ttl: float = float(conf["ttl"])
+        self._delay: float = float(conf["delay"])
+        self._devices: int = int(conf["devices"])
+        self._budget: int = int(conf["requests_per_minute"])
+        self._budget_window: float = 0
+        self._budget_used: int = 0
+        self._history: dict[int, AccessHistory] = {}
+        self._task: asyncio.Task | None = None
+        self._next_user: int | None = None
+        self._versions: dict[int, int] = {}  # bumped by invalidate(), so that a prefetch in flight doesn't cache what the device was before a command
+        self.hits: int = 0
+        self.misses: int = 0
+        self.prefetched: int = 0
+        self.over_budget: int = 0
+        logging.debug(f"Prefetch enabled: {self.enabled}; ttl: {self._ttl}s; budget: {self._budget}/min.")
+
+    def __key__(self, kind: str, device_id: int) -> str:
+        # the epoch is part of the key so that clear() drops all entries, in all instances, at once
+        return f"prefetch:{self.hubitat.state.get('prefetch_epoch') or 0}:{kind}:{device_id}"
+
+    def clear(self) -> None:
+        self.hubitat.state.set("prefetch_epoch", time.time())
+
+    def get_cached(self, kind: str, device_id: int) -> dict | None:
+        # only prefetched values are ever cached, so hits & misses measure how well prefetching guesses.
+        # What callers fetch on a miss is not cached: it would be served stale to the next command
+        if not self.enabled:
+            return None
+        value = self.hubitat.state.get(self.__key__(kind, device_id))
+        if value is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return value
+
+    def invalidate(self, device_id: int) -> None:
+        self._versions[device_id] = self._versions.get(device_id, 0) + 1
+        self.hubitat.state.delete(self.__key__("status", device_id))
+        self.hubitat.state.delete(self.__key__("info", device_id))
+
+    def record_access(self, user_id: int, device_ids: list[int]) -> None:
+        if not self.enabled:
+            return
+        history = self._history.setdefault(user_id, AccessHistory())
+        for device_id in device_ids:
+            history.add(device_id)
+
+    def prefetch(self, user_id: int) -> None:
+        if not self.enabled or user_id not in self._history:
+            return
+        # a single prefetch at a time, so real commands always win; the latest request runs once the current one is done
+        self._next_user = user_id
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.__run__())
+
+    async def __run__(self) -> None:
+        while self._next_user is not None:
+            user_id, self._next_user = self._next_user, None
+            await self.__prefetch__(self._history[user_id].likely_next(self._devices))
+
+    def __take_budget__(self) -> bool:
+        now = time.monotonic()
+        if now - self._budget_window >= 60:
+            self._budget_window = now
+            self._budget_used = 0
+        if self._budget_used >= self._budget:
+            self.over_budget += 1
+            return False
+        self._budget_used += 1
+        return True
+
+    async def __prefetch__(self, device_ids: list[int]) -> None:
+        # give the hub time to apply the command that was just sent
+        await asyncio.sleep(self._delay)
+        for device_id in device_ids:
+            for kind, fetch in [("status", self.hubitat.api.device_status), ("info", self.hubitat.api.get_device_info)]:
+                if self.hubitat.state.get(self.__key__(kind, device_id)) is not None:
+                    continue
+                if not self.__take_budget__():
+                    return
+                version = self._versions.get(device_id, 0)
+                try:
+                    value = await asyncio.to_thread(fetch, device_id)
+                except Exception as e:
+                    logging.warning(f"Unable to prefetch {kind} for device {device_id}: {e}")
+                    return
+                if version != self._versions.get(device_id, 0):
+                    continue  # a command was sent to the device meanwhile: what was fetched may be stale
+                self.hubitat.state.set(self.__key__(kind, device_id), value, self._ttl)
+                self.prefetched += 1
+
+    def get_stats(self) -> dict[str, str]:
+        lookups = self.hits + self.misses
+        hit_rate = f"{100 * self.hits / lookups:.0f}%" if lookups else "n/a"
+        return {
+            "enabled": str(self.enabled),
+            "hit rate": hit_rate,
+            "hits": str(self.hits),
+            "misses": str(self.misses),
+            "prefetched": str(self.prefetched),
+            "over budget": str(self.over_budget),
+        }
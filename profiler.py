@@ -0,0 +1,68 @@
+import cProfile
+import logging
+import os
+import pstats
+import time
+
+from config import get_app_path
+
+
+class ProfileEntry:
+    def __init__(self, calls: int, total_time: float, cumulative_time: float, function: str):
+        self.calls: int = calls
+        self.total_time: float = total_time
+        self.cumulative_time: float = cumulative_time
+        self.function: str = function
+
+
+class Profiler:
+    # cProfile session over the thread running the event loop, i.e. all handlers.
+    # Nothing is hooked while not started, so there is no overhead when off.
+    def __init__(self, conf: dict):
+        self._on_start: bool = bool(conf["profile"])
+        self._file: str = get_app_path(conf["profile_file"]) if conf["profile_file"] else ""
+        self._profile: cProfile.Profile | None = None
+        self._started: float = 0
+
+    def is_running(self) -> bool:
+        return self._profile is not None
+
+    def start_if_configured(self) -> None:
+        if self._on_start:
+            self.start()
+
+    def start(self) -> bool:
+        if self._profile is not None:
+            return False
+        logging.warning("Starting profiler.")
+        self._profile = cProfile.Profile()
+        self._started = time.monotonic()
+        self._profile.enable()
+        return True
+
+    def get_duration(self) -> float:
+        return time.monotonic() - self._started if self._profile else 0
+
+    # returns the functions where the most time was spent, and the file where the full profile was saved, if any
+    def stop(self, count: int = 15) -> tuple[list[ProfileEntry], str]:
+        if self._profile is None:
+            return [], ""
+        self._profile.disable()
+        logging.warning("Stopped profiler.")
+        stats = pstats.Stats(self._profile)
+        self._profile = None
+        file = ""
+        if self._file:
+            try:
+                stats.dump_stats(self._file)
+                file = self._file
+            except OSError as e:
+                logging.error(f"Unable to save profile to {self._file}.", exc_info=e)
+
+        entries = []
+        # stats.stats: {(file, line, function): (primitive calls, calls, total time, cumulative time, callers)}
+        for (file_name, line, function), (_, calls, total_time, cumulative_time, _) in stats.stats.items():  # type: ignore[attr-defined]
+            name = f"{os.path.basename(file_name)}:{line}({function})" if line else function
+            entries.append(ProfileEntry(calls, total_time, cumulative_time, name))
+        entries.sort(key=lambda e: e.total_time, reverse=True)
+        return entries[:count], file
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+import time
+from typing import Hashable
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "idle")
+
+    def __init__(self, tokens: float, updated: float, idle: float):
+        self.tokens: float = tokens
+        self.updated: float = updated
+        self.idle: float = idle  # time for an empty bucket to be full again; past that it's the same as a new one
+
+
+class RateLimiter:
+    # Token buckets keyed by anything hashable (user id, device id, ...), refilled at rate_per_minute
+    # up to burst tokens. Buckets idle long enough to be full again are evicted, so memory is
+    # O(1) per active key.
+    def __init__(self, name: str, rate_per_minute: float, burst: int):
+        self.name: str = name
+        self.throttled: int = 0
+        self._buckets: OrderedDict[Hashable, TokenBucket] = OrderedDict()
+        self._rate: float = rate_per_minute / 60
+        self._burst: int = max(1, burst)
+
+    def __evict__(self, now: float) -> None:
+        # buckets are ordered by last use, so idle ones are at the front
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket.updated < bucket.idle:
+                break
+            del self._buckets[key]
+
+    def try_acquire(self, key: Hashable = None, rate_per_minute: float | None = None, burst: int | None = None) -> bool:
+        # rate_per_minute & burst override the limiter's defaults for this key (e.g. depending on the user's access level)
+        rate = self._rate if rate_per_minute is None else rate_per_minute / 60
+        if rate <= 0:
+            return True
+        capacity = self._burst if burst is None else max(1, burst)
+        now = time.monotonic()
+        self.__evict__(now)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = TokenBucket(capacity, now, capacity / rate)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        self._buckets[key] = bucket  # most recently used last
+        if bucket.tokens < 1:
+            self.throttled += 1
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def refund(self, key: Hashable = None) -> None:
+        # gives back the token of a request that was not sent after all
+        bucket = self._buckets.get(key, None)
+        if bucket is not None:
+            bucket.tokens += 1
+
+    def active_keys(self) -> int:
+        return len(self._buckets)
@@ -0,0 +1,65 @@
+import re
+from typing import Callable
+
+from device import Device
+
+# Markdown special characters are escaped with a single str.translate pass instead of a regex substitution
+_MARKDOWN_SPECIAL = "_*[]()~`>#+-=|.!"
+_MARKDOWN_ESCAPES = str.maketrans({c: "\\" + c for c in _MARKDOWN_SPECIAL})
+# characters that were already escaped by the caller end up double escaped: undo that
+_MARKDOWN_DOUBLE_ESCAPED = re.compile(r"\\\\([_*\[\]()~`>\#\+\-=|\.!])")
+
+# Rows of the fixed-width tables sent in ``` blocks
+EVENTS_ROW = "{:20}|{:12}|{:10}".format
+USERS_ROW = "{:10}|{:5}|{:10}|{}".format
+SUMMARY_ROW = "{:12}|{:5}|{}".format
+AUDIT_ROW = "{:19}|{:10}|{:8}|{:15}|{:7}|{:>6}".format
+PROFILE_ROW = "{:>7}|{:>7}|{:>7}|{}".format
+
+
+def markdown_escape(text: str) -> str:
+    if not text:
+        return ""
+    text = text.translate(_MARKDOWN_ESCAPES)
+    if "\\\\" in text:
+        text = _MARKDOWN_DOUBLE_ESCAPED.sub(r"\1", text)
+    return text
+
+
+class Renderer:
+    # Memoizes the markdown of device labels & descriptions, and of the /list rows built from them.
+    # These only change with the devices inventory, so the memo is dropped when the inventory generation changes.
+    def __init__(self, get_generation: Callable[[], int]):
+        self._get_generation = get_generation
+        self._generation: int | None = None
+        self._escaped: dict[str, str] = {}
+        self._device_rows: dict[tuple[int, bool], str] = {}
+
+    def __check_generation__(self) -> None:
+        generation = self._get_generation()
+        if generation != self._generation:
+            self._generation = generation
+            self._escaped = {}
+            self._device_rows = {}
+
+    def escape(self, text: str) -> str:
+        # only for inventory strings: anything else would grow the memo until the next inventory refresh
+        self.__check_generation__()
+        escaped = self._escaped.get(text, None)
+        if escaped is None:
+            escaped = self._escaped[text] = markdown_escape(text)
+        return escaped
+
+    def device_row(self, device: Device, detailed: bool) -> str:
+        self.__check_generation__()
+        key = (device.id, detailed)
+        row = self._device_rows.get(key, None)
+        if row is None:
+            if detailed:
+                row = f"{self.escape(device.label)}: `{device.id}` ({device.type}) {self.escape(device.description)}"
+            elif device.description:
+                row = f"{self.escape(device.label)} : {self.escape(device.description)}"
+            else:
+                row = f"{self.escape(device.label)} "
+            self._device_rows[key] = row
+        return row
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import platform
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+
+from config import get_app_path
+
+
+class StateBackend(ABC):
+    # State shared between bot instances: device inventory, read caches, user settings and leader lease.
+    @abstractmethod
+    def get(self, key: str) -> Any | None: ...
+
+    # ttl in seconds; 0 for no expiration
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float = 0) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    # acquire or renew the lease; returns True if owner holds the lease
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool: ...
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str) -> None: ...
+
+
+class MemoryStateBackend(StateBackend):
+    # Default backend: state is private to the process, and the process is always the leader
+    def __init__(self) -> None:
+        self._values: dict[str, tuple[float, Any]] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+
+    def get(self, key: str) -> Any | None:
+        entry = self._values.get(key, None)
+        if entry is None:
+            return None
+        if entry[0] and entry[0] <= time.time():
+            del self._values[key]
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float = 0) -> None:
+        self._values[key] = (time.time() + ttl if ttl else 0, value)
+
+    def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        lease = self._leases.get(name, None)
+        if lease and lease[0] != owner and lease[1] > now:
+            return False
+        self._leases[name] = (owner, now + ttl)
+        return True
+
+    def release_lease(self, name: str, owner: str) -> None:
+        lease = self._leases.get(name, None)
+        if lease and lease[0] == owner:
+            del self._leases[name]
+
+
+class SqliteStateBackend(StateBackend):
+    # State shared by all bot instances that can access the same file, e.g. replicas on one host or sharing a volume
+    def __init__(self, file: str) -> None:
+        logging.info(f"Shared state file: {file}")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ? AND (expires = 0 OR expires > ?)", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float = 0) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, json.dumps(value), now + ttl if ttl else 0))
+            # opportunistically drop a few expired entries
+            self._conn.execute("DELETE FROM kv WHERE key IN (SELECT key FROM kv WHERE expires > 0 AND expires <= ? LIMIT 10)", (now,))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires WHERE leases.owner = excluded.owner OR leases.expires <= ?",
+                (name, owner, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+def create_state_backend(conf: dict) -> StateBackend:
+    match conf["backend"]:
+        case "memory":
+            return MemoryStateBackend()
+        case "sqlite":
+            return SqliteStateBackend(get_app_path(conf["file"]))
+        case backend:
+            raise ValueError(f"Unknown state backend '{backend}'. Supported values: memory, sqlite.")
+
+
+class LeaderElection:
+    # Only the leader polls Telegram and talks to the hub; other instances are warm standbys
+    # waiting for the leader's lease to expire.
+    def __init__(self, state: StateBackend, lease_seconds: float) -> None:
+        self._state = state
+        self._ttl = lease_seconds
+        self.owner = f"{platform.node()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: asyncio.Task | None = None
+
+    def wait_for_leadership(self, on_standby: Callable[[], None]) -> None:
+        if self._state.acquire_lease("leader", self.owner, self._ttl):
+            logging.info(f"Instance {self.owner} is the leader.")
+            return
+        logging.warning(f"Instance {self.owner} is on standby.")
+        while True:
+            on_standby()
+            time.sleep(self._ttl / 3)
+            if self._state.acquire_lease("leader", self.owner, self._ttl):
+                logging.warning(f"Instance {self.owner} took over as the leader.")
+                return
+
+    def start(self, on_lost: Callable[[], None]) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.__keep__(on_lost))
+
+    async def __keep__(self, on_lost: Callable[[], None]) -> None:
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self._ttl / 3)
+            try:
+                renewed = await asyncio.to_thread(self._state.acquire_lease, "leader", self.owner, self._ttl)
+            except Exception as e:
+                logging.error("Unable to renew leader lease.", exc_info=e)
+                # transient errors are tolerated as long as the lease has not expired
+                renewed = time.monotonic() - renewed_at < self._ttl
+            else:
+                renewed_at = time.monotonic() if renewed else renewed_at
+            if not renewed:
+                logging.error(f"Instance {self.owner} lost the leader lease.")
+                on_lost()
+                return
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._state.release_lease("leader", self.owner)
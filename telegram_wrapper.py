@@ -2,15 +2,17 @@ from accesslevel import AccessLevel
 from device import DeviceGroup
 from hubitat import Hubitat
 import logging
+from ratelimit import RateLimiter
 from telegram.ext import Application
 
 
 class TelegramUser:
-    def __init__(self, id: int, access_level: AccessLevel, user_group: str, device_groups: list[DeviceGroup]) -> None:
+    def __init__(self, id: int, access_level: AccessLevel, user_group: str, device_groups: list[DeviceGroup], rate_limit: tuple[float, int] = (0, 0)) -> None:
         self.id: int = id
         self.access_level: AccessLevel = access_level
         self.user_group: str = user_group
         self.device_groups: list[DeviceGroup] = device_groups
+        self.rate_limit: tuple[float, int] = rate_limit  # commands per minute, burst
         logging.debug(f"User={id}; AccessLevel:={access_level}; UserGroup={self.user_group}.")
 
     def has_access(self, requested: AccessLevel) -> bool:
@@ -24,6 +26,8 @@ class Telegram:
         self.rejected_message: str = conf["rejected_message"]
         self.start_message: str = conf["start_message"]
         self.nobody = TelegramUser(-1, AccessLevel.NONE, "nobody", []) # default user for unknown ids
+        self.user_limiter = RateLimiter("user", 0, 0)  # limits are per user, see TelegramUser.rate_limit
+        rate_limits: dict[str, list] = conf["rate_limits"] or {}
         enabled_user_groups = conf["enabled_user_groups"]
         if not enabled_user_groups:
             raise ValueError("enabled_user_groups (config file) or HUBIBOT_TELEGRAM_ENABLED_USER_GROUPS (env var, cmd line param) must be set.")
@@ -37,13 +41,17 @@ class Telegram:
                 if device_group not in hubitat.device_groups:
                     raise ValueError(f"Device group '{device_group}' listed in user group '{group_name}' not defined in hubitat settings")
             device_groups = [hubitat.get_device_group(name) for name in device_group_names]
+            # group specific rate limit, or the default one for the group's access level
+            rate_limit = group_data.get("rate_limit", None) or rate_limits.get(access_level.name, None) or [0, 0]
+            if len(rate_limit) != 2:
+                raise ValueError(f"rate_limit for Telegram user group '{group_name}' must be of the form [per minute, burst].")
             ids = list(map(int, group_data["ids"]))
             if not ids:
                 raise ValueError(f"ids list for Telegram user group '{group_name}' must be set.")
             for id in ids:
                 if id in self.users:
                     raise ValueError(f"User id {id} is referenced in both groups '{group_name}' and '{self.users[id].user_group}'.")
-                self.users[id] = TelegramUser(id, access_level, group_name, device_groups)
+                self.users[id] = TelegramUser(id, access_level, group_name, device_groups, (float(rate_limit[0]), int(rate_limit[1])))
 
         self.application = Application.builder().token(conf["token"]).build()
 